@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 from modules.home import render_home_page
 from modules.calendar_page import render_calendar_page
@@ -12,9 +13,15 @@ st.set_page_config(
 )
 
 # Load CSS
-def load_css(file_name):
+@st.cache_data
+def _read_css(file_name, mtime):
+    # mtime is only part of the cache key so edits to the file are picked up
     with open(file_name) as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+        return f.read()
+
+def load_css(file_name):
+    css = _read_css(file_name, os.path.getmtime(file_name))
+    st.markdown(f'<style>{css}</style>', unsafe_allow_html=True)
 
 load_css("assets/style.css")
 
@@ -44,12 +51,15 @@ if "synced" not in st.session_state:
         status_placeholder.info(msg)
     
     with st.spinner("Syncing historical data..."):
-        backend.sync_data(update_status)
+        sync_ok = backend.sync_data(update_status)
     
-    status_placeholder.success("Sync complete!")
     st.session_state.synced = True
-    # Rerun to refresh views with new data
-    st.rerun()
+    if sync_ok:
+        status_placeholder.success("Sync complete!")
+        # Rerun to refresh views with new data
+        st.rerun()
+    # On a partial sync keep the warning on screen; the next session retries
+    status_placeholder.warning("Sync stopped early; missing days will be fetched on the next sync.")
 
 # Sidebar Navigation
 st.sidebar.title("Navigation")
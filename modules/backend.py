@@ -1,12 +1,30 @@
 import garth
 import datetime
+import html
 import os
-from typing import List, Dict, Any, Optional
-from garminconnect import Garmin
+import random
+import time
+import threading
+import concurrent.futures
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+from garminconnect import Garmin, GarminConnectTooManyRequestsError
+from modules.database import Activity
 
 SESSION_DIR = os.path.expanduser("~/.garth")
 garmin_client = None
 
+# Neither client is documented as thread-safe, and both refresh their OAuth
+# tokens inside the request call, so each allows one request at a time.
+_garmin_lock = threading.Lock()
+_garth_lock = threading.Lock()
+
+# Sync fetches the backfill in chunks on a small pool to stay under Garmin's rate limit.
+# With one request per client at a time, two workers keep both clients busy.
+SYNC_CHUNK_DAYS = 28
+SYNC_WORKERS = 2
+MAX_RETRIES = 5
+
 def login(email: str = None, password: str = None) -> bool:
     """
     Authenticates with Garmin Connect using both garth and garminconnect.
@@ -25,95 +43,101 @@ def login(email: str = None, password: str = None) -> bool:
                 return False
 
         # 2. GarminConnect Login (for activities)
-        # We need email/password for this as it doesn't share garth's session dir directly in this context
-        # If we resumed garth, we might not have email/pass if not provided.
-        # But app.py asks for them if not logged in.
-        # If we are resuming, we might have an issue if we don't have credentials for Garmin()
-        # For now, we assume if we are logging in via UI, we have them.
-        # If we are resuming, we might need to rely on garth for everything OR fail if we can't init Garmin.
-        
-        # Limitation: Garmin library needs password to login. 
-        # If we only have garth session, we can't init Garmin client without prompting user.
-        # However, for this implementation, let's assume we have credentials or we fail.
-        
-        if email and password:
-            garmin_client = Garmin(email, password)
-            garmin_client.login()
-            return True
-        elif garth.client.oauth2_token:
-            # If we are here, we resumed garth but don't have creds for Garmin.
-            # This is a tricky state. 
-            # Ideally we should store creds securely or use garth for everything.
-            # But user specifically asked for Garmin client for activities.
-            # We will return False to force re-login in UI if we don't have garmin_client ready.
-            return False
-            
-        return False
+        # garminconnect 0.3 keeps its own token file (garmin_tokens.json) in
+        # SESSION_DIR. It is loaded when present, so a warm start needs no
+        # password; otherwise the credentials are used and the new tokens are
+        # written there for the next start.
+        client = Garmin(email, password)
+        client.login(SESSION_DIR)
+
+        garmin_client = client
+        return True
     except Exception as e:
         print(f"Login failed: {e}")
         return False
 
-def get_daily_data(date: datetime.date) -> Dict[str, Any]:
+def _is_rate_limited(e: Exception) -> bool:
+    """True for HTTP 429 responses from either garminconnect or garth."""
+    if isinstance(e, GarminConnectTooManyRequestsError):
+        return True
+    response = getattr(getattr(e, "error", None), "response", None)
+    return getattr(response, "status_code", None) == 429
+
+def _with_retry(lock: threading.Lock, func, *args, **kwargs):
     """
-    Fetches steps and activities for a specific date.
+    Calls func while holding its client's lock, retrying with exponential
+    backoff and jitter while rate limited. The lock is released during backoff.
     """
-    global garmin_client
-    try:
-        # Ensure we have clients ready
-        if not garth.client.oauth2_token or not garmin_client:
-             return {"date": date, "steps": 0, "activities": [], "error": "Not logged in"}
-
-        # 1. Fetch Activities using GarminConnect
-        # The user wants to use client.get_activities(start=0, limit=limit)
-        # We'll fetch a batch and filter.
+    for attempt in range(MAX_RETRIES):
         try:
-            activities_list = garmin_client.get_activities(start=0, limit=50)
+            with lock:
+                return func(*args, **kwargs)
         except Exception as e:
-             print(f"Error fetching activities with Garmin client: {e}")
-             activities_list = []
-
-        day_activities = []
-        for act in activities_list:
-            start_time_str = act.get('startTimeLocal', '')
-            if start_time_str.startswith(str(date)):
-                day_activities.append(act)
-
-        # 2. Fetch Steps using Garth
-        # garth.DailySteps.list(period=N) returns the last N days.
-        today = datetime.date.today()
-        days_diff = (today - date).days
-        
-        steps = 0
-        
-        if days_diff >= 0:
-            period = days_diff + 2 
-            try:
-                daily_steps_list = garth.DailySteps.list(period=period)
-                for daily_step in daily_steps_list:
-                    if daily_step.calendar_date == date:
-                        steps = daily_step.total_steps
-                        break
-            except Exception as e:
-                print(f"Error fetching steps for {date}: {e}")
-        
-        # Ensure steps is not None
-        if steps is None:
-            steps = 0
-            
-        return {
-            "date": date,
-            "steps": steps,
-            "activities": day_activities
-        }
+            if not _is_rate_limited(e) or attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(2 ** attempt * 0.5 + random.uniform(0, 0.5))
 
-    except Exception as e:
-        print(f"Error fetching data for {date}: {e}")
-        return {"date": date, "steps": 0, "activities": [], "error": str(e)}
+def get_range_data(start_date: datetime.date, end_date: datetime.date, parallel: bool = False) -> Dict[datetime.date, Dict[str, Any]]:
+    """
+    Fetches steps and activities for every day in [start_date, end_date] with
+    one activity search and one steps request, bucketed by date locally.
+    With parallel=True the two requests run concurrently; sync leaves it off
+    since its own worker pool already bounds the requests in flight.
+    Raises if either request fails, so callers never mistake a failed fetch
+    for days with no steps or activities.
+    """
+    global garmin_client
+    days = (end_date - start_date).days + 1
+    result = {
+        start_date + datetime.timedelta(days=i): {"steps": 0, "activities": []}
+        for i in range(days)
+    }
+    if days <= 0:
+        return result
+
+    if not garth.client.oauth2_token or not garmin_client:
+        raise RuntimeError("Not logged in")
+
+    # 1. Activities: the date-filtered search paginates internally
+    # 2. Steps: one request ending at end_date covering the whole range
+    # A single-thread pool runs them back to back on one worker thread
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2 if parallel else 1) as executor:
+        activities_future = executor.submit(_with_retry, _garmin_lock, garmin_client.get_activities_by_date, start_date.isoformat(), end_date.isoformat())
+        steps_future = executor.submit(_with_retry, _garth_lock, garth.DailySteps.list, end=end_date, period=days)
+
+    # Bucket on the "YYYY-MM-DD" prefix of the local start time
+    activities_by_date: Dict[str, List[Activity]] = {}
+    for act in activities_future.result():
+        activities_by_date.setdefault(act.get('startTimeLocal', '')[:10], []).append(Activity.from_garmin(act))
+
+    for daily_step in steps_future.result():
+        if daily_step.calendar_date in result and daily_step.total_steps is not None:
+            result[daily_step.calendar_date]["steps"] = daily_step.total_steps
 
-def calculate_points(steps: int, activities: List[Dict[str, Any]]) -> int:
+    for date, data in result.items():
+        data["activities"] = activities_by_date.get(date.isoformat(), [])
+    return result
+
+def calculate_points(steps: int, activities: List[Activity]) -> int:
     """
     Calculates activity points based on the user's rules.
     """
+    # Activities are hashable tuples, so results can be cached
+    return _calc(steps, tuple(activities))
+
+def build_tooltip(steps: int, activities: List[Activity]) -> str:
+    """
+    Builds the hover text for a day: steps, then one line per activity.
+    """
+    tooltip_lines = [f"Steps: {steps}"] + [
+        f"{act.type_key or 'Activity'}: {act.duration_sec // 60}m (HR: {act.avg_hr})"
+        for act in activities
+    ]
+    # Escape the joined text in one pass, then encode newlines as an HTML entity
+    return html.escape("\n".join(tooltip_lines)).replace("\n", "&#10;")
+
+@lru_cache(maxsize=512)
+def _calc(steps: Optional[int], act_tuple: Tuple[Activity, ...]) -> int:
     points = 0
     
     # Ensure steps is valid
@@ -129,11 +153,7 @@ def calculate_points(steps: int, activities: List[Dict[str, Any]]) -> int:
         points += 3
         
     # 2. Activities
-    for act in activities:
-        activity_type = act.get('activityType', {}).get('typeKey', '')
-        duration_sec = act.get('duration', 0)
-        avg_hr = act.get('averageHR', 0)
-        
+    for activity_type, duration_sec, avg_hr in act_tuple:
         if not avg_hr:
             continue
             
@@ -160,7 +180,7 @@ from modules import database
 # Initialize DB on module load (or call explicitly in app)
 database.init_db()
 
-# ... (existing login, get_daily_data, calculate_points functions)
+# ... (existing login, get_range_data, calculate_points functions)
 
 def sync_data(status_callback=None):
     """
@@ -168,6 +188,8 @@ def sync_data(status_callback=None):
     - If DB empty: fetch from 2025-02-01.
     - If DB has data: fetch from latest_date + 1 day.
     - Stops at yesterday (today's data is fetched live or handled separately).
+    Returns False if a fetch failed, in which case only the days before the
+    failure are saved and the next sync retries from there.
     """
     latest_date = database.get_latest_date()
     today = datetime.date.today()
@@ -180,28 +202,63 @@ def sync_data(status_callback=None):
     if start_date > yesterday:
         if status_callback:
             status_callback("Data is up to date.")
-        return
+        return True
 
-    current_date = start_date
-    total_days = (yesterday - start_date).days + 1
-    processed = 0
+    if status_callback:
+        status_callback(f"Syncing {start_date} to {yesterday}...")
 
-    while current_date <= yesterday:
-        if status_callback:
-            status_callback(f"Syncing {current_date} ({processed + 1}/{total_days})...")
-            
-        # Fetch data
-        data = get_daily_data(current_date)
-        
+    # Fetch the range in chunks on a bounded pool instead of re-querying per day
+    chunks = []
+    chunk_start = start_date
+    while chunk_start <= yesterday:
+        chunk_end = min(chunk_start + datetime.timedelta(days=SYNC_CHUNK_DAYS - 1), yesterday)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + datetime.timedelta(days=1)
+
+    range_data = {}
+    failed_from = None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+        results = executor.map(lambda c: get_range_data(*c), chunks)
+        for done, (chunk_start, chunk_end) in enumerate(chunks, start=1):
+            try:
+                range_data.update(next(results))
+            except Exception as e:
+                # Keep only the chunks before the failure: the next sync resumes
+                # after the latest saved date, so saving past a gap would lose it
+                print(f"Error fetching data for {chunk_start} - {chunk_end}: {e}")
+                failed_from = chunk_start
+                executor.shutdown(cancel_futures=True)
+                break
+            if status_callback:
+                status_callback(f"Fetched {done}/{len(chunks)} chunks...")
+
+    rows = []
+    for current_date, data in range_data.items():
         # Calculate points
         points = calculate_points(data["steps"], data["activities"])
-        
-        # Save to DB
-        database.save_daily_data(current_date, data["steps"], points, data["activities"])
-        
-        current_date += datetime.timedelta(days=1)
-        processed += 1
-        
+        tooltip = build_tooltip(data["steps"], data["activities"])
+        rows.append((current_date, data["steps"], points, data["activities"], tooltip))
+
+    # Save to DB in a single transaction
+    if status_callback:
+        status_callback(f"Saving {len(rows)} days...")
+    database.save_daily_batch(rows)
+
+    if failed_from:
+        if status_callback:
+            status_callback(f"Sync stopped at {failed_from}; it will resume from there next time.")
+        return False
+
     if status_callback:
         status_callback("Sync complete!")
+    return True
 
+def recompute_points() -> int:
+    """
+    Recalculates points for every stored day from its saved steps and activities,
+    e.g. after a change to the point rules. Returns the number of days updated.
+    """
+    stored = database.get_data_range(datetime.date.min, datetime.date.max)
+    rows = [(date, calculate_points(data["steps"], data["activities"])) for date, data in stored.items()]
+    database.update_points(rows)
+    return len(rows)
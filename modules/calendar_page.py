@@ -1,7 +1,49 @@
 import streamlit as st
 import datetime
 import calendar
-from modules import database
+from functools import lru_cache
+from modules import backend, database
+
+_CAL = calendar.Calendar(firstweekday=0)
+_DAY_ABBR = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+# Indexed by whether the day reached the daily target
+_MINI_CLASS = ("mini-circle", "mini-circle completed")
+_DAY_CELL_TPL = ('<div class="calendar-day" style="width: 14%%;">'
+                 '<span style="align-self: flex-start; color: #888;">%d</span>'
+                 '<div class="%s">%s</div>'
+                 '<span class="tooltip-text">%s</span></div>')
+_EMPTY_CELL = "<div style='width: 14%;'></div>"
+_HEADER_ROW = ("<div class='calendar-row' style='display: flex; justify-content: space-around; padding: 5px;'>"
+               + "".join(f"<div class='calendar-header' style='width: 14%;'>{day}</div>" for day in _DAY_ABBR)
+               + "</div>")
+
+@lru_cache(maxsize=256)
+def _month_weeks(year: int, month: int) -> tuple:
+    """Returns the Monday-first week rows for a month, with 0 for padding days."""
+    return tuple(tuple(week) for week in _CAL.monthdayscalendar(year, month))
+
+def months_since(start_year: int, start_month: int, today: datetime.date) -> list:
+    """Returns (year, month) pairs from the start month up to today's month, oldest first."""
+    first = start_year * 12 + start_month - 1
+    total = (today.year * 12 + today.month - 1) - first + 1
+    return [((first + i) // 12, (first + i) % 12 + 1) for i in range(total)]
+
+# Cached reads keyed on the DB modification time, so a sync invalidates them.
+# Bounded, since every sync leaves the previous keys behind.
+@st.cache_data(max_entries=32)
+def _cached_data_range(start_date: datetime.date, end_date: datetime.date, db_mtime: float) -> dict:
+    return database.get_data_range(start_date, end_date)
+
+@st.cache_data(max_entries=32)
+def _cached_points_range(start_date: datetime.date, end_date: datetime.date, db_mtime: float) -> dict:
+    return database.get_points_range(start_date, end_date)
+
+@st.cache_data
+def _month_options(today: datetime.date) -> tuple:
+    """Returns (months, labels) from Feb 2025 to today's month, latest first."""
+    months = list(reversed(months_since(2025, 2, today)))
+    labels = [datetime.date(y, m, 1).strftime("%B %Y") for y, m in months]
+    return months, labels
 
 def render_calendar_page():
     st.markdown("<h1 style='text-align: center;'>Activity Calendar</h1>", unsafe_allow_html=True)
@@ -13,58 +55,45 @@ def render_calendar_page():
     
     today = datetime.date.today()
     
-    # Generate list of months from Feb 2025 to Today
-    start_date = datetime.date(2025, 2, 1)
-    months = []
-    curr = start_date
-    while curr <= today:
-        months.append(curr)
-        # Move to next month
-        if curr.month == 12:
-            curr = datetime.date(curr.year + 1, 1, 1)
-        else:
-            curr = datetime.date(curr.year, curr.month + 1, 1)
-            
-    # Reverse to show latest first
-    months.reverse()
-    
-    # Format for selectbox
-    month_options = [d.strftime("%B %Y") for d in months]
-    selected_month_str = st.selectbox("Select Month", month_options)
+    months, month_options = _month_options(today)
     
-    # Parse selected month
-    selected_month_date = datetime.datetime.strptime(selected_month_str, "%B %Y").date()
-    year = selected_month_date.year
-    month = selected_month_date.month
+    # Select by index so the choice maps straight back to (year, month)
+    selected = st.selectbox("Select Month", range(len(month_options)), format_func=month_options.__getitem__)
+    year, month = months[selected]
     
-    cal = calendar.monthcalendar(year, month)
+    cal = _month_weeks(year, month)
     
     # Fetch data for the whole month from DB
     _, last_day = calendar.monthrange(year, month)
     month_start = datetime.date(year, month, 1)
     month_end = datetime.date(year, month, last_day)
     
-    db_data = database.get_data_range(month_start, month_end)
+    db_mtime = database.last_modified()
+    db_data = _cached_data_range(month_start, month_end, db_mtime)
+
+    # Weekly totals for the highlight, computed once for every displayed week.
+    # The range is widened to full Mon-Sun weeks so rows that span a month
+    # boundary are judged on the whole week, matching the home page goal.
+    grid_start = month_start - datetime.timedelta(days=month_start.weekday())
+    grid_end = month_end + datetime.timedelta(days=6 - month_end.weekday())
+    week_data = _cached_points_range(grid_start, grid_end, db_mtime)
+    week_totals = {}
+    for d, d_data in week_data.items():
+        week_start = d - datetime.timedelta(days=d.weekday())
+        week_totals[week_start] = week_totals.get(week_start, 0) + (d_data.get("points") or 0)
     
     # Debug info
     st.info(f"Loaded {len(db_data)} days of data for {month_options[0] if month_options else ''}")
     
-    # Header
-    cols = st.columns(7)
-    days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-    for i, day in enumerate(days):
-        cols[i].markdown(f"<div class='calendar-header'>{day}</div>", unsafe_allow_html=True)
+    # Header and grid are emitted as a single markdown block
+    page_parts = [_HEADER_ROW]
 
     # Grid
     for week in cal:
-        # Calculate weekly points for highlighting
-        weekly_total = 0
-        for day in week:
-            if day == 0: continue
-            d_date = datetime.date(year, month, day)
-            d_data = db_data.get(d_date)
-            if d_data:
-                weekly_total += d_data.get("points", 0)
+        # Look up weekly points for highlighting
+        first_day = next(day for day in week if day != 0)
+        first_date = datetime.date(year, month, first_day)
+        weekly_total = week_totals.get(first_date - datetime.timedelta(days=first_date.weekday()), 0)
         
         row_class = "week-row-highlight" if weekly_total >= 40 else ""
         
@@ -82,11 +111,11 @@ def render_calendar_page():
         # The user asked to "highlight the whole week row".
         # Let's build the HTML for the row manually.
         
-        html_row = f"<div class='calendar-row {row_class}' style='display: flex; justify-content: space-around; padding: 5px; border-radius: 10px; margin-bottom: 5px;'>"
+        page_parts.append(f"<div class='calendar-row {row_class}' style='display: flex; justify-content: space-around; padding: 5px; border-radius: 10px; margin-bottom: 5px;'>")
         
         for i, day in enumerate(week):
             if day == 0:
-                html_row += "<div style='width: 14%;'></div>"
+                page_parts.append(_EMPTY_CELL)
                 continue
             
             current_date = datetime.date(year, month, day)
@@ -94,26 +123,16 @@ def render_calendar_page():
             points = day_data["points"] if day_data else 0
             if points is None: points = 0
             
-            steps = day_data.get("steps", 0) if day_data else 0
-            activities = day_data.get("activities", []) if day_data else []
-            
-            # Tooltip
-            tooltip_lines = [f"Steps: {steps}"]
-            for act in activities:
-                act_type = act.get('activityType', {}).get('typeKey', 'Activity')
-                duration = act.get('duration', 0) // 60
-                avg_hr = act.get('averageHR', 0)
-                tooltip_lines.append(f"{act_type}: {duration}m (HR: {avg_hr})")
-            tooltip_text = "&#10;".join(tooltip_lines)
+            # Tooltips are prebuilt at sync time; rows saved before that fall back to building one
+            if day_data:
+                tooltip_text = day_data.get("tooltip") or backend.build_tooltip(day_data.get("steps", 0), day_data.get("activities", []))
+            else:
+                tooltip_text = backend.build_tooltip(0, [])
 
-            # Logic
-            classes = ["mini-circle"]
-            if points >= 8:
-                classes.append("completed")
-            
-            class_str = " ".join(classes)
+            class_str = _MINI_CLASS[points >= 8]
             
-            html_row += f"""<div class="calendar-day" style="width: 14%;"><span style="align-self: flex-start; color: #888;">{day}</span><div class="{class_str}">{points if points > 0 else "-"}</div><span class="tooltip-text">{tooltip_text}</span></div>"""
+            page_parts.append(_DAY_CELL_TPL % (day, class_str, points if points > 0 else "-", tooltip_text))
         
-        html_row += "</div>"
-        st.markdown(html_row, unsafe_allow_html=True)
+        page_parts.append("</div>")
+
+    st.markdown("".join(page_parts), unsafe_allow_html=True)
@@ -2,83 +2,175 @@ import sqlite3
 import datetime
 import json
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
 
 DB_FILE = "activities.db"
 
+# A single connection is shared by every Streamlit session thread; the lock
+# keeps one statement/transaction on it at a time.
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+def get_connection() -> sqlite3.Connection:
+    """Returns the shared database connection, opening it on first use."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+        _conn.execute('PRAGMA journal_mode=WAL')
+        _conn.execute('PRAGMA synchronous=NORMAL')
+        _conn.execute('PRAGMA temp_store=MEMORY')
+    return _conn
+
+class Activity(NamedTuple):
+    """The fields of a Garmin activity the app uses."""
+    type_key: str
+    duration_sec: float
+    avg_hr: float
+
+    @classmethod
+    def from_garmin(cls, act: Dict[str, Any]) -> "Activity":
+        """Builds an Activity from a raw Garmin Connect activity dict."""
+        return cls(
+            (act.get('activityType') or {}).get('typeKey') or '',
+            act.get('duration') or 0,
+            act.get('averageHR') or 0,
+        )
+
+def last_modified() -> float:
+    """Returns the latest modification time of the database, including its WAL file."""
+    mtimes = [os.path.getmtime(path) for path in (DB_FILE, DB_FILE + "-wal") if os.path.exists(path)]
+    return max(mtimes, default=0.0)
+
 def init_db():
     """Initializes the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS daily_stats (
-            date TEXT PRIMARY KEY,
-            steps INTEGER,
-            points INTEGER,
-            activities_json TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with _lock, conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                date TEXT PRIMARY KEY,
+                steps INTEGER,
+                points INTEGER,
+                activities_json TEXT,
+                tooltip TEXT
+            )
+        ''')
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(daily_stats)')]
+        if 'tooltip' not in columns:
+            conn.execute('ALTER TABLE daily_stats ADD COLUMN tooltip TEXT')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS activities (
+                date TEXT,
+                type TEXT,
+                duration_sec REAL,
+                avg_hr REAL,
+                FOREIGN KEY(date) REFERENCES daily_stats(date)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_activities_date ON activities(date)')
+
+        # Copy activities from the legacy JSON column into the activities table.
+        # The raw JSON is kept: it holds fields the table drops, and sync never
+        # refetches stored days. Days already copied are skipped.
+        legacy = conn.execute('''
+            SELECT date, activities_json FROM daily_stats
+            WHERE activities_json IS NOT NULL AND activities_json != '[]'
+              AND date NOT IN (SELECT date FROM activities)
+        ''').fetchall()
+        for date_str, activities_json in legacy:
+            conn.executemany(
+                'INSERT INTO activities (date, type, duration_sec, avg_hr) VALUES (?, ?, ?, ?)',
+                _activity_rows(date_str, [Activity.from_garmin(act) for act in json.loads(activities_json)])
+            )
+
+def _activity_rows(date_str: str, activities: List[Activity]) -> List[Tuple[str, str, float, float]]:
+    """Flattens activities into activities table rows."""
+    return [(date_str, *act) for act in activities]
 
-def save_daily_data(date: datetime.date, steps: int, points: int, activities: List[Dict[str, Any]]):
+def save_daily_data(date: datetime.date, steps: int, points: int, activities: List[Activity], tooltip: Optional[str] = None):
     """Saves or updates daily data."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        INSERT OR REPLACE INTO daily_stats (date, steps, points, activities_json)
-        VALUES (?, ?, ?, ?)
-    ''', (str(date), steps, points, json.dumps(activities)))
-    conn.commit()
-    conn.close()
+    save_daily_batch([(date, steps, points, activities, tooltip)])
+
+def save_daily_batch(rows: List[Tuple[datetime.date, int, int, List[Activity], Optional[str]]]):
+    """Saves or updates many days of (date, steps, points, activities, tooltip) in one transaction."""
+    conn = get_connection()
+    with _lock, conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO daily_stats (date, steps, points, activities_json, tooltip)
+            VALUES (?, ?, ?, NULL, ?)
+        ''', [(str(date), steps, points, tooltip) for date, steps, points, _, tooltip in rows])
+        conn.executemany('DELETE FROM activities WHERE date = ?', [(str(row[0]),) for row in rows])
+        conn.executemany(
+            'INSERT INTO activities (date, type, duration_sec, avg_hr) VALUES (?, ?, ?, ?)',
+            [act_row for date, _, _, activities, _ in rows for act_row in _activity_rows(str(date), activities)]
+        )
+
+def update_points(rows: List[Tuple[datetime.date, int]]):
+    """Overwrites the stored points for many (date, points) pairs in one transaction."""
+    conn = get_connection()
+    with _lock, conn:
+        conn.executemany('UPDATE daily_stats SET points = ? WHERE date = ?', [(points, str(date)) for date, points in rows])
 
 def get_data_for_date(date: datetime.date) -> Optional[Dict[str, Any]]:
     """Retrieves data for a specific date."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT steps, points, activities_json FROM daily_stats WHERE date = ?', (str(date),))
-    row = c.fetchone()
-    conn.close()
-    
-    if row:
-        return {
-            "date": date,
-            "steps": row[0],
-            "points": row[1],
-            "activities": json.loads(row[2])
-        }
-    return None
+    data = get_data_range(date, date).get(date)
+    if data:
+        data["date"] = date
+    return data
 
 def get_data_range(start_date: datetime.date, end_date: datetime.date) -> Dict[datetime.date, Dict[str, Any]]:
     """Retrieves data for a date range."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        SELECT date, steps, points, activities_json 
-        FROM daily_stats 
-        WHERE date >= ? AND date <= ?
-    ''', (str(start_date), str(end_date)))
-    rows = c.fetchall()
-    conn.close()
-    
+    conn = get_connection()
+    with _lock:
+        rows = conn.execute('''
+            SELECT d.date, d.steps, d.points, d.tooltip, a.type, a.duration_sec, a.avg_hr
+            FROM daily_stats d
+            LEFT JOIN activities a ON a.date = d.date
+            WHERE d.date >= ? AND d.date <= ?
+            ORDER BY d.date, a.rowid
+        ''', (str(start_date), str(end_date))).fetchall()
+
+    result = {}
+    current_str, current = None, None
+    for row in rows:
+        if row[0] != current_str:
+            current_str = row[0]
+            date_obj = datetime.date.fromisoformat(row[0])
+            current = result[date_obj] = {
+                "steps": row[1],
+                "points": row[2],
+                "tooltip": row[3],
+                "activities": []
+            }
+        if row[4] is not None:
+            current["activities"].append(Activity(row[4], row[5], row[6] or 0))
+    return result
+
+def get_points_range(start_date: datetime.date, end_date: datetime.date) -> Dict[datetime.date, Dict[str, int]]:
+    """Retrieves steps and points for a date range, without loading activities."""
+    conn = get_connection()
+    with _lock:
+        rows = conn.execute('''
+            SELECT date, steps, points
+            FROM daily_stats
+            WHERE date BETWEEN ? AND ?
+        ''', (str(start_date), str(end_date))).fetchall()
+
     result = {}
     for row in rows:
-        date_obj = datetime.datetime.strptime(row[0], "%Y-%m-%d").date()
+        date_obj = datetime.date.fromisoformat(row[0])
         result[date_obj] = {
             "steps": row[1],
-            "points": row[2],
-            "activities": json.loads(row[3])
+            "points": row[2]
         }
     return result
 
 def get_latest_date() -> Optional[datetime.date]:
     """Returns the latest date stored in the database."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT MAX(date) FROM daily_stats')
-    row = c.fetchone()
-    conn.close()
-    
+    conn = get_connection()
+    with _lock:
+        row = conn.execute('SELECT MAX(date) FROM daily_stats').fetchone()
+
     if row and row[0]:
-        return datetime.datetime.strptime(row[0], "%Y-%m-%d").date()
+        return datetime.date.fromisoformat(row[0])
     return None
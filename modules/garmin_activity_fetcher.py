@@ -2,7 +2,8 @@
 Garmin Connect Activity Data Fetcher
 
 This script connects to the Garmin Connect service to download a user's latest
-activity data. It prompts for a username and password, and then fetches a
+activity data. It resumes the session saved in ~/.garth (prompting for a
+username and password only when needed), and then fetches a
 specified number of recent activities, displaying key details for each one.
 
 It uses the 'garth' library to handle authentication and API communication.
@@ -19,6 +20,10 @@ except ImportError:
     print("pip install garth")
     exit()
 
+SESSION_DIR = "~/.garth"
+ACTIVITIES_URL = "/activitylist-service/activities/search/activities"
+PAGE_SIZE = 100
+
 def display_activities(activities):
     """Formats and prints a list of activities."""
     if not activities:
@@ -45,27 +50,48 @@ def display_activities(activities):
         print(f"  - Duration: {duration_formatted}")
         print(f"  - Distance: {distance_km:.2f} km")
 
+def fetch_activities(limit, page_size=PAGE_SIZE):
+    """Fetches up to `limit` most recent activities, paging until a short page is returned."""
+    activities = []
+    while len(activities) < limit:
+        batch_size = min(page_size, limit - len(activities))
+        batch = garth.connectapi(
+            ACTIVITIES_URL,
+            params={"start": len(activities), "limit": batch_size},
+        ) or []
+        activities.extend(batch)
+        if len(batch) < batch_size:
+            break
+    return activities
+
+def login():
+    """Resumes the cached garth session, prompting for credentials only if it is missing or expired."""
+    try:
+        garth.resume(SESSION_DIR)
+        garth.client.username # Verify validity
+        print("\nResumed saved session.")
+        return
+    except Exception:
+        pass
+
+    # Prompt for user credentials
+    email = input("Enter your Garmin Connect email: ")
+    password = getpass.getpass("Enter your password: ")
+
+    # The garth library will cache the session in ~/.garth to avoid future logins
+    garth.login(email, password)
+    garth.save(SESSION_DIR)
+
+    print("\nLogin successful!")
+
 def main():
     """Main function to run the data fetching process."""
     print("--- Garmin Connect Data Fetcher ---")
-    print("You will be prompted for your email and password.")
+    print("You will be prompted for your email and password if no saved session is found.")
     print("Your credentials are used once for login and are not stored in this script.")
 
     try:
-        # Prompt for user credentials
-        email = input("Enter your Garmin Connect email: ")
-        password = getpass.getpass("Enter your password: ")
-
-        # Initialize the Garmin client and attempt to log in
-        # The garth library will cache the session in ~/.garth to avoid future logins
-        
-        # client = garth.Client()
-        # client.login(email, password)
-        
-        garth.login(email, password)
-        garth.save("~/.garth")
-        
-        print("\nLogin successful!")
+        login()
         
         # Get number of activities to fetch
         while True:
@@ -81,7 +107,7 @@ def main():
         print(f"\nFetching the last {limit} activities...")
         
         # Fetch the activities from the Garmin Connect API
-        recent_activities = garth.connectapi.get_activities(start=0, limit=limit)
+        recent_activities = fetch_activities(limit)
         
         display_activities(recent_activities)
 
@@ -1,84 +1,119 @@
 import streamlit as st
-import datetime
-from modules import backend
+import time
+from datetime import date, timedelta
+from modules import backend, database
+
+# How long today's data (and the page built from it) is reused before refetching
+TODAY_REFRESH_SECS = 300
+
+_DAY_ABBR = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+# Future days carry no data, so their circles are fixed per weekday.
+# Both tables are indexed by whether the week goal was met, then per day.
+_FUTURE_CIRCLES = tuple(
+    tuple(f"""<div class="activity-circle-wrapper"><div class="activity-circle future{' week-goal' if goal else ''}"></div><div class="day-label">{day}</div></div>"""
+          for day in _DAY_ABBR)
+    for goal in (False, True)
+)
+# Circle classes for past days, indexed by week goal met, then daily target reached
+_CLASS_TABLE = tuple(
+    tuple("activity-circle" + (" completed" if completed else "") + (" week-goal" if goal else "")
+          for completed in (False, True))
+    for goal in (False, True)
+)
+# Daily points are small, so their display strings are built once
+_POINT_STRS = tuple(str(i) for i in range(100))
+# Past-day circle markup per weekday, with the day label baked in
+_CIRCLE_TPLS = tuple(
+    '<div class="activity-circle-wrapper"><div class="%s">%s</div>'
+    f'<div class="day-label">{day}</div><span class="tooltip-text">%s</span></div>'
+    for day in _DAY_ABBR
+)
+
+# Past days of the week come from the synced database, keyed on its
+# modification time so a sync invalidates them. Today, plus any past day the
+# database doesn't have yet (a tab left open past midnight, or a partial
+# sync), is fetched live and refreshed every few minutes. A failed fetch
+# raises, so st.cache_data never stores it.
+@st.cache_data(max_entries=8)
+def _load_past_days(start_of_week: date, today: date, db_mtime: float) -> dict:
+    if start_of_week >= today:
+        return {}
+    return database.get_data_range(start_of_week, today - timedelta(days=1))
+
+@st.cache_data(ttl=TODAY_REFRESH_SECS)
+def _fetch_live(start_date: date, today: date) -> dict:
+    return backend.get_range_data(start_date, today, parallel=True)
 
 def render_home_page():
-    st.markdown("<h1 style='text-align: center;'>Weekly Activity</h1>", unsafe_allow_html=True)
+    today = date.today()
+    db_mtime = database.last_modified()
 
-    today = datetime.date.today()
-    start_of_week = today - datetime.timedelta(days=today.weekday())
-    
-    # Fetch data for the week
-    # To optimize, we could fetch in batch if backend supported it, but loop is fine for 7 days
-    weekly_points = {}
+    # The markup only changes with the day, the stored data and today's
+    # refresh window, so reruns with the same inputs re-emit the last build
+    fingerprint = (today, db_mtime, int(time.time() // TODAY_REFRESH_SECS))
+    if st.session_state.get("home_fingerprint") == fingerprint:
+        st.markdown(st.session_state.home_html, unsafe_allow_html=True)
+        return
+
+    start_of_week = today - timedelta(days=today.weekday())
+    week_dates = [start_of_week + timedelta(days=i) for i in range(7)]
     
-    # Progress bar or spinner could be nice here
     with st.spinner("Fetching weekly data..."):
-        for i in range(7):
-            day_date = start_of_week + datetime.timedelta(days=i)
-            if day_date > today:
-                weekly_points[i] = 0
-                continue
-                
-            data = backend.get_daily_data(day_date)
-            points = backend.calculate_points(data["steps"], data["activities"])
-            weekly_points[i] = points
+        range_data = dict(_load_past_days(week_dates[0], today, db_mtime))
+        # One request from the first day missing from the database up to today
+        live_start = next((d for d in week_dates[:today.weekday()] if d not in range_data), today)
+        try:
+            range_data.update(_fetch_live(live_start, today))
+            today_ok = True
+        except Exception as e:
+            print(f"Error fetching data for {live_start} - {today}: {e}")
+            today_ok = False
+
+    # One (data, points) slot per weekday, keeping each day's data for the tooltips
+    weekly_data = [({"steps": 0, "activities": []}, 0)] * 7
+    for i, day_date in enumerate(week_dates):
+        data = range_data.get(day_date)
+        if data is not None:
+            weekly_data[i] = (data, backend.calculate_points(data["steps"], data["activities"]))
 
-    total_weekly_points = sum(weekly_points.values())
+    total_weekly_points = sum(points for _, points in weekly_data)
     week_goal_met = total_weekly_points >= 40
 
     # HTML Construction for Circles
-    html_content = '<div class="activity-container">'
-    
-    days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+    # Heading, circles and caption go out in a single markdown block
+    parts = ["<h1 style='text-align: center;'>Weekly Activity</h1>", '<div class="activity-container">']
     
-    for i in range(7):
-        current_day_date = start_of_week + datetime.timedelta(days=i)
-        points = weekly_points.get(i, 0)
-        day_name = days[i]
-        
-        # Fetch detailed data for tooltip
-        # We need to fetch data again or store it. 
-        # Optimization: We fetched it above but didn't store details. 
-        # Let's refactor slightly to store details in weekly_points or fetch again (fetch is fast if cached/local)
-        # For simplicity and since we have get_daily_data, let's just re-fetch or better yet, store it in the first loop.
-        # Actually, let's just fetch it here, it's local DB or cached.
+    # The week goal is fixed for the whole loop, so pick its tables once
+    future_circles = _FUTURE_CIRCLES[week_goal_met]
+    circle_classes = _CLASS_TABLE[week_goal_met]
+
+    for i, current_day_date in enumerate(week_dates):
+        if current_day_date > today:
+            parts.append(future_circles[i])
+            continue
+
+        data, points = weekly_data[i]
         
-        data = backend.get_daily_data(current_day_date)
         steps = data.get("steps", 0)
         activities = data.get("activities", [])
         
-        # Build Tooltip Text
-        tooltip_lines = [f"Steps: {steps}"]
-        for act in activities:
-            act_type = act.get('activityType', {}).get('typeKey', 'Activity')
-            duration = act.get('duration', 0) // 60
-            avg_hr = act.get('averageHR', 0)
-            tooltip_lines.append(f"{act_type}: {duration}m (HR: {avg_hr})")
-            
-        tooltip_text = "&#10;".join(tooltip_lines) # HTML entity for newline
-        
-        # Determine classes
-        classes = ["activity-circle"]
-        
-        if current_day_date > today:
-            classes.append("future")
-            display_text = ""
-        else:
-            display_text = str(points)
-            if points >= 8:
-                classes.append("completed")
+        tooltip_text = backend.build_tooltip(steps, activities)
         
-        if week_goal_met:
-            classes.append("week-goal")
-            
-        class_str = " ".join(classes)
+        display_text = _POINT_STRS[points] if points < 100 else str(points)
+        class_str = circle_classes[points >= 8]
         
-        html_content += f"""<div class="activity-circle-wrapper"><div class="{class_str}">{display_text}</div><div class="day-label">{day_name}</div><span class="tooltip-text">{tooltip_text}</span></div>"""
+        parts.append(_CIRCLE_TPLS[i] % (class_str, display_text, tooltip_text))
         
-    html_content += '</div>'
+    parts.append('</div>')
+
+    # Debug/Info
+    parts.append(f'<div class="weekly-caption">Total Weekly Points: {total_weekly_points} / 40</div>')
     
+    html_content = "".join(parts)
+    if today_ok:
+        st.session_state.home_fingerprint = fingerprint
+        st.session_state.home_html = html_content
+    else:
+        # Not stored, so the next rerun tries the fetch again
+        st.warning("Couldn't fetch this week's latest data from Garmin Connect; showing the stored days only.")
     st.markdown(html_content, unsafe_allow_html=True)
-    
-    # Debug/Info
-    st.caption(f"Total Weekly Points: {total_weekly_points} / 40")